@@ -0,0 +1,135 @@
+# Tracks which road is waiting on which other road, to catch gridlocks and long stalls
+# A road "waits on" another road when the vehicle at the head of its intersection queue failed to enter that road
+# Every road has at most one head vehicle, so every road waits on at most one road
+# That makes the wait-for graph a bunch of chains that can end in at most one cycle -> a cycle is a gridlock
+# Reporting and policies are applied by Simulator.handle_gridlocks, this class only keeps the bookkeeping
+from typing import List, Dict, Optional, Tuple, Any, Callable
+
+RoadKey = Tuple[int, int]
+
+POLICIES = ('report', 'remove_vehicle', 'halt')
+
+
+class GridlockDetector:
+    def __init__(self, gridlock_threshold: float = 100.0, stall_threshold: float = 300.0, policy: str = 'report'):
+        # gridlock_threshold: how long a wait-for cycle has to stay closed before it counts as a gridlock
+        # Keep it above the longest traffic light cycle, a head vehicle is only retried when its road is green
+        # stall_threshold: how long a queue head can be blocked before its road is reported as stalled
+        # policy: 'report' only logs, 'halt' stops the run,
+        # 'remove_vehicle' takes vehicles off the back of one full road in the cycle until the queue waiting on it can enter
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown gridlock policy {policy!r}, expected one of {POLICIES}")
+        self.gridlock_threshold = gridlock_threshold
+        self.stall_threshold = stall_threshold
+        self.policy = policy
+
+        self.waits_on: Dict[RoadKey, RoadKey] = {}
+        # Both dicts are filled in time order, so the oldest entries are always at the front
+        self._blocked_since: Dict[RoadKey, float] = {}
+        self.stalled_roads: Dict[RoadKey, float] = {}
+
+        self._cycle_of: Dict[RoadKey, int] = {}
+        self._cycles: Dict[int, Tuple[RoadKey, ...]] = {}
+        self._cycle_closed_at: Dict[int, float] = {}
+        self.gridlocked_cycles: Dict[int, Tuple[RoadKey, ...]] = {}
+        self._next_cycle_id = 1
+
+        self.gridlocks_detected = 0
+
+    # Called when the head of the queue coming from `road` could not enter `wanted`
+    def mark_blocked(self, road: RoadKey, wanted: RoadKey, current_time: float):
+        if self.waits_on.get(road) == wanted:
+            # Same head still stuck on the same road, nothing changed
+            return
+        if road in self.waits_on:
+            self.mark_clear(road)
+        if wanted == road:
+            # A vehicle queued after its first hop asks for the road it just left (see Intersection._try_release_vehicle)
+            # That road drains into this very queue, so it is not a dependency on anything else
+            return
+
+        self.waits_on[road] = wanted
+        self._blocked_since[road] = current_time
+
+        # Only a new edge can close a new cycle, and only through `road` itself
+        # The walk stops early when it runs into a chain end or an already known cycle
+        # Worst case it visits the whole downstream chain, O(roads), but only when an edge is new or changed
+        node = wanted
+        while node != road:
+            if node in self._cycle_of or node not in self.waits_on:
+                return
+            node = self.waits_on[node]
+
+        cycle = [road]
+        node = wanted
+        while node != road:
+            cycle.append(node)
+            node = self.waits_on[node]
+
+        cycle_id = self._next_cycle_id
+        self._next_cycle_id += 1
+        self._cycles[cycle_id] = tuple(cycle)
+        self._cycle_closed_at[cycle_id] = current_time
+        for member in cycle:
+            self._cycle_of[member] = cycle_id
+
+    # Called when the head of the queue coming from `road` was released, or the queue was emptied
+    def mark_clear(self, road: RoadKey):
+        if self.waits_on.pop(road, None) is None:
+            return
+        if self._blocked_since.pop(road, None) is None:
+            self.stalled_roads.pop(road, None)
+
+        cycle_id = self._cycle_of.get(road)
+        if cycle_id is not None:
+            cycle = self._cycles.pop(cycle_id, None) or self.gridlocked_cycles.pop(cycle_id)
+            self._cycle_closed_at.pop(cycle_id, None)
+            for member in cycle:
+                del self._cycle_of[member]
+
+    # Called once per step, returns the gridlock cycles and stalled roads that crossed their threshold this step
+    # Loops over every entry that expired this step, oldest first, and stops at the first one that has not
+    # Each entry leaves the pending dicts once, so this is amortized O(1) per step
+    # Expired cycles cost O(cycle length) each for the is_blocked check
+    # is_blocked(road) tells whether a road still cannot be entered, a cycle is only reported if all its wanted roads are
+    # Cycles that fail that check are still flowing, their timer starts again from now
+    def check(self, current_time: float,
+              is_blocked: Optional[Callable[[RoadKey], bool]] = None) -> Tuple[List[Tuple[RoadKey, ...]], List[RoadKey]]:
+        new_gridlocks = []
+        rechecked = []
+        while self._cycle_closed_at:
+            cycle_id, closed_at = next(iter(self._cycle_closed_at.items()))
+            if current_time - closed_at < self.gridlock_threshold:
+                break
+            del self._cycle_closed_at[cycle_id]
+            if is_blocked is not None and not all(is_blocked(self.waits_on[road]) for road in self._cycles[cycle_id]):
+                rechecked.append(cycle_id)
+                continue
+            cycle = self._cycles.pop(cycle_id)
+            self.gridlocked_cycles[cycle_id] = cycle
+            self.gridlocks_detected += 1
+            new_gridlocks.append(cycle)
+        for cycle_id in rechecked:
+            self._cycle_closed_at[cycle_id] = current_time
+
+        new_stalls = []
+        while self._blocked_since:
+            road, since = next(iter(self._blocked_since.items()))
+            if current_time - since < self.stall_threshold:
+                break
+            del self._blocked_since[road]
+            self.stalled_roads[road] = since
+            new_stalls.append(road)
+
+        return new_gridlocks, new_stalls
+
+    def is_gridlocked(self) -> bool:
+        return bool(self.gridlocked_cycles)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            'gridlocks_detected': self.gridlocks_detected,
+            'active_gridlocks': len(self.gridlocked_cycles),
+            'blocked_roads': len(self.waits_on),
+            'stalled_roads': len(self.stalled_roads)
+        }
@@ -51,6 +51,17 @@ class Intersection:
             logging.error(f"Intersection {self.node_id}: Road from {at_node} karke koi node incoming mein hai hi nai")
             return False
             
+    # Changes the light timings of this intersection, works before and after finalize_setup
+    def set_light_timings(self, green_duration: Optional[int] = None, yellow_duration: Optional[int] = None):
+        # Validate first so a bad value leaves both this and the traffic light untouched
+        TrafficLight.validate_durations(green_duration, yellow_duration)
+        if self.traffic_light is not None:
+            self.traffic_light.set_durations(green_duration, yellow_duration)
+        if green_duration is not None:
+            self.green_duration = green_duration
+        if yellow_duration is not None:
+            self.yellow_duration = yellow_duration
+
     def update(self, dt: float):
         if self.traffic_light:
             self.traffic_light.update(dt)
@@ -77,6 +88,8 @@ class Intersection:
         max_releases = max(1, int(1 * dt)) 
         released = 0
         
+        detector = simulator.gridlock_detector
+        road_key = (green_road_start_node, self.node_id)
         while queue and released < max_releases:
             vehicle_id = queue[0]
             vehicle = simulator.vehicles.get(vehicle_id)
@@ -84,8 +97,22 @@ class Intersection:
             if vehicle and self._try_release_vehicle(vehicle, simulator):
                 queue.popleft()
                 released += 1
+                if detector:
+                    detector.mark_clear(road_key)
             else:
+                # Head is stuck, remember which road it is waiting on for gridlock detection
+                if detector and vehicle:
+                    wanted = self._next_road_key(vehicle)
+                    if wanted:
+                        detector.mark_blocked(road_key, wanted, simulator.current_time)
                 break 
+
+    # The (start, end) of the road the vehicle will try to enter when released, same lookup as _try_release_vehicle
+    def _next_road_key(self, vehicle: Vehicle) -> Optional[Tuple[int, int]]:
+        next_node = vehicle.get_next_node()
+        if next_node is None:
+            return None
+        return (vehicle.path[vehicle.path_index], next_node)
                 
     def _try_release_vehicle(self, vehicle: Vehicle, simulator) -> bool:
         if vehicle.is_at_destination():
@@ -0,0 +1,345 @@
+# Runs a Simulator in the background and lets clients drive it live over a local socket
+# Protocol: newline delimited JSON, one command per line from the client, one message per line back
+#   -> {"cmd": "subscribe"}
+#   <- {"type": "reply", "cmd": "subscribe", "ok": true}
+#   <- {"type": "metrics", "step": 10, "time": 10.0, "changed": {...}}
+# Only the metrics that changed since the last message sent to that client are pushed
+import asyncio
+import json
+import logging
+from typing import List, Dict, Optional, Tuple, Any
+
+from Simulator import Simulator
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class _Client:
+    """One connected socket. Replies and metric diffs all go out through a single writer task."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.subscribed = False
+        self.last_sent: Dict[str, Any] = {}
+        self.replies: List[Dict[str, Any]] = []
+        self.wakeup = asyncio.Event()
+        self.writer_task: Optional[asyncio.Task] = None
+        # Set on shutdown, the writer task sends whatever is pending and then closes the socket
+        self.closing = False
+        self.closed = False
+
+
+class SimulationService:
+    def __init__(self, sim: Simulator, host: str = '127.0.0.1', port: int = 8765,
+                 real_time_factor: Optional[float] = 1.0, spawn_rate: float = 0.01,
+                 spawn_interval: int = 10, metrics_interval: int = 1, shutdown_timeout: float = 1.0,
+                 max_spawn_count: int = 1000, max_pending_replies: int = 100):
+        # real_time_factor: simulated seconds per wall clock second, None or 0 runs as fast as possible
+        self.sim = sim
+        self.host = host
+        self.port = port
+        self.real_time_factor = real_time_factor
+        self.spawn_rate = spawn_rate
+        self.spawn_interval = spawn_interval
+        self.metrics_interval = max(1, metrics_interval)
+        # How long serve() waits for clients to receive their last messages when stopping
+        self.shutdown_timeout = shutdown_timeout
+        # Upper bound for spawn counts and rates sent by clients, spawning runs on the event loop
+        self.max_spawn_count = max_spawn_count
+        # A client with more unsent replies than this is not reading its socket and gets disconnected
+        self.max_pending_replies = max_pending_replies
+        self.step_count = 0
+        self.clients: List[_Client] = []
+        self.latest_metrics: Dict[str, Any] = {}
+        # Step and time the latest snapshot was taken at, sent along with its diff
+        self.latest_step = 0
+        self.latest_time = 0.0
+        self._paused = False
+        self._resume_event: Optional[asyncio.Event] = None
+        # Set by set_speed, pause and stop so the step loop does not sit out a long real time delay
+        self._wake_event: Optional[asyncio.Event] = None
+        self._stop_event: Optional[asyncio.Event] = None
+        self._server = None
+
+    async def serve(self):
+        """Start the socket server and the step loop, returns after a stop command or stop()."""
+        self._resume_event = asyncio.Event()
+        self._resume_event.set()
+        self._wake_event = asyncio.Event()
+        self._stop_event = asyncio.Event()
+
+        self.sim.finalize_network_setup()
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        # port=0 lets the OS pick a free port, keep the one actually bound
+        self.port = self._server.sockets[0].getsockname()[1]
+        logging.info(f"Simulation service listening on {self.host}:{self.port}")
+
+        step_task = asyncio.ensure_future(self._step_loop())
+        try:
+            await self._stop_event.wait()
+        finally:
+            step_task.cancel()
+            self._server.close()
+            await self._shutdown_clients()
+            # From Python 3.12.1 this waits for every open connection, so the clients have to be closed first
+            await self._server.wait_closed()
+            logging.info("Simulation service stopped.")
+
+    # Lets every client receive its pending replies (e.g. the reply to "stop") before closing it
+    async def _shutdown_clients(self):
+        writer_tasks = []
+        for client in list(self.clients):
+            client.closing = True
+            client.wakeup.set()
+            if client.writer_task is not None:
+                writer_tasks.append(client.writer_task)
+        if writer_tasks:
+            await asyncio.wait(writer_tasks, timeout=self.shutdown_timeout)
+        for client in list(self.clients):
+            self._close_client(client)
+
+    def stop(self):
+        if self._stop_event is not None:
+            self._stop_event.set()
+            self._wake_event.set()
+
+    async def _step_loop(self):
+        try:
+            await self._run_steps()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Without this the task would die silently and the service would keep taking commands for a dead loop
+            logging.exception(f"Simulation step failed at {self.sim.current_time:.0f}s, stopping the service")
+            self._publish_metrics(finished=True)
+            for client in self.clients:
+                client.replies.append({'type': 'error', 'step': self.step_count,
+                                       'time': self.sim.current_time, 'error': str(e)})
+                client.wakeup.set()
+            self.stop()
+
+    async def _run_steps(self):
+        loop = asyncio.get_running_loop()
+        self._publish_metrics()
+
+        while self.sim.current_time < self.sim.total_time and not self.sim.halted:
+            if self._stop_event.is_set():
+                return
+            if self._paused:
+                await self._resume_event.wait()
+                continue
+
+            started = loop.time()
+            # Same spawning as Simulator.run
+            if self.spawn_interval > 0 and self.step_count % self.spawn_interval == 0:
+                self.sim.spawn_random_vehicles(self.spawn_rate)
+            self.sim.step()
+            self.step_count += 1
+
+            if self.step_count % self.metrics_interval == 0:
+                self._publish_metrics()
+
+            # Commands and client writers only run while we are awaiting here, so a step never sees half applied state
+            await self._wait_for_next_step(loop, started)
+
+        self._publish_metrics(finished=True)
+        logging.info("Simulation complete! Service keeps serving until stopped.")
+
+    # Waits out the real time delay of the step that began at `started`
+    # The delay is recomputed whenever _wake_event is set, so a new speed, a pause or a stop applies right away
+    async def _wait_for_next_step(self, loop: asyncio.AbstractEventLoop, started: float):
+        while self.real_time_factor and not self._paused and not self._stop_event.is_set():
+            remaining = started + self.sim.dt / self.real_time_factor - loop.time()
+            if remaining <= 0:
+                break
+            self._wake_event.clear()
+            try:
+                await asyncio.wait_for(self._wake_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+        await asyncio.sleep(0)
+
+    # Stores the newest snapshot and wakes up the subscribers
+    # Never waits on a client, slow clients just get one bigger diff later on
+    # collect_metrics() grows with the completed vehicles, so nothing is collected while nobody is subscribed
+    def _publish_metrics(self, finished: bool = False):
+        if not any(client.subscribed for client in self.clients):
+            return
+        metrics = self.sim.collect_metrics()
+        metrics['finished'] = finished or self.sim.current_time >= self.sim.total_time or self.sim.halted
+        metrics['paused'] = self._paused
+        self.latest_metrics = metrics
+        self.latest_step = self.step_count
+        self.latest_time = self.sim.current_time
+        for client in self.clients:
+            if client.subscribed:
+                client.wakeup.set()
+
+    @staticmethod
+    def _diff(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in new.items() if key not in old or old[key] != value}
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = _Client(writer)
+        self.clients.append(client)
+        client.writer_task = asyncio.ensure_future(self._client_writer(client))
+        try:
+            while not client.closed:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Line longer than the stream limit, the rest of the stream can't be trusted anymore
+                    client.replies.append({'type': 'reply', 'cmd': None, 'ok': False, 'error': 'Command line too long'})
+                    client.closing = True
+                    client.wakeup.set()
+                    break
+                if not line:
+                    break
+                line = line.strip()
+                if not line:
+                    continue
+                if len(client.replies) >= self.max_pending_replies:
+                    logging.warning("Client is not reading its replies, disconnecting it")
+                    break
+                client.replies.append(self._handle_command(client, line))
+                client.wakeup.set()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if not client.closing:
+                self._close_client(client)
+                client.writer_task.cancel()
+
+    async def _client_writer(self, client: _Client):
+        try:
+            while not client.closed:
+                await client.wakeup.wait()
+                client.wakeup.clear()
+
+                messages = client.replies
+                client.replies = []
+                if client.subscribed and self.latest_metrics:
+                    # Diff against what this client last saw, not against the previous step
+                    changed = self._diff(client.last_sent, self.latest_metrics)
+                    if changed:
+                        messages.append({'type': 'metrics', 'step': self.latest_step,
+                                         'time': self.latest_time, 'changed': changed})
+                        client.last_sent = dict(self.latest_metrics)
+
+                for message in messages:
+                    client.writer.write((json.dumps(message) + '\n').encode())
+                await client.writer.drain()
+                if client.closing:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self._close_client(client)
+
+    def _close_client(self, client: _Client):
+        if client.closed:
+            return
+        client.closed = True
+        client.wakeup.set()
+        if client in self.clients:
+            self.clients.remove(client)
+        client.writer.close()
+
+    def _handle_command(self, client: _Client, line: bytes) -> Dict[str, Any]:
+        try:
+            command = json.loads(line)
+            cmd = command.get('cmd')
+        except (ValueError, AttributeError):
+            return {'type': 'reply', 'cmd': None, 'ok': False, 'error': 'Invalid JSON command'}
+
+        handler = getattr(self, f"_cmd_{cmd}", None) if isinstance(cmd, str) else None
+        if handler is None:
+            return {'type': 'reply', 'cmd': cmd, 'ok': False, 'error': f"Unknown command {cmd!r}"}
+        try:
+            result = handler(client, command) or {}
+        except (KeyError, TypeError, ValueError) as e:
+            return {'type': 'reply', 'cmd': cmd, 'ok': False, 'error': str(e)}
+        reply = {'type': 'reply', 'cmd': cmd, 'ok': True}
+        reply.update(result)
+        return reply
+
+    # --- Commands ---
+
+    def _cmd_subscribe(self, client: _Client, command: Dict[str, Any]):
+        client.subscribed = True
+        # First message after subscribing carries the full snapshot, taken now as none was kept while unsubscribed
+        client.last_sent = {}
+        self._publish_metrics()
+
+    def _cmd_unsubscribe(self, client: _Client, command: Dict[str, Any]):
+        client.subscribed = False
+
+    def _cmd_snapshot(self, client: _Client, command: Dict[str, Any]):
+        return {'step': self.step_count, 'time': self.sim.current_time, 'metrics': self.sim.collect_metrics()}
+
+    def _cmd_add_vehicle(self, client: _Client, command: Dict[str, Any]):
+        start, destination = int(command['start']), int(command['destination'])
+        if start not in self.sim.intersections or destination not in self.sim.intersections:
+            raise ValueError(f"Unknown intersection in {start} -> {destination}")
+        vehicle_id = self.sim.next_vehicle_id
+        self.sim.add_vehicle(start, destination)
+        spawned = self.sim.next_vehicle_id != vehicle_id
+        return {'spawned': spawned, 'vehicle_id': vehicle_id if spawned else None}
+
+    def _cmd_spawn(self, client: _Client, command: Dict[str, Any]):
+        count = int(command.get('count', 1))
+        if count < 1 or count > self.max_spawn_count:
+            raise ValueError(f"count must be between 1 and {self.max_spawn_count}")
+        before = self.sim.next_vehicle_id
+        self.sim.spawn_random_vehicles(count)
+        return {'spawned': self.sim.next_vehicle_id - before}
+
+    def _cmd_set_spawn_rate(self, client: _Client, command: Dict[str, Any]):
+        # Parse both before applying either, like set_light
+        spawn_rate = float(command.get('spawn_rate', self.spawn_rate))
+        spawn_interval = int(command.get('spawn_interval', self.spawn_interval))
+        if spawn_rate < 0 or spawn_rate > self.max_spawn_count:
+            raise ValueError(f"spawn_rate must be between 0 and {self.max_spawn_count}")
+        self.spawn_rate = spawn_rate
+        self.spawn_interval = spawn_interval
+        return {'spawn_rate': self.spawn_rate, 'spawn_interval': self.spawn_interval}
+
+    def _cmd_set_light(self, client: _Client, command: Dict[str, Any]):
+        node_id = int(command['node_id'])
+        intersection = self.sim.intersections.get(node_id)
+        if intersection is None:
+            raise ValueError(f"Unknown intersection {node_id}")
+        intersection.set_light_timings(command.get('green_duration'), command.get('yellow_duration'))
+        return {'green_duration': intersection.green_duration, 'yellow_duration': intersection.yellow_duration}
+
+    def _cmd_set_speed(self, client: _Client, command: Dict[str, Any]):
+        real_time_factor = command.get('real_time_factor')
+        if real_time_factor is not None and real_time_factor < 0:
+            raise ValueError("real_time_factor cannot be negative")
+        self.real_time_factor = real_time_factor
+        self._wake_event.set()
+        return {'real_time_factor': self.real_time_factor}
+
+    def _cmd_pause(self, client: _Client, command: Dict[str, Any]):
+        self._paused = True
+        self._resume_event.clear()
+        self._wake_event.set()
+        self._publish_metrics()
+
+    def _cmd_resume(self, client: _Client, command: Dict[str, Any]):
+        self._paused = False
+        self._resume_event.set()
+        self._publish_metrics()
+
+    def _cmd_stop(self, client: _Client, command: Dict[str, Any]):
+        self.stop()
+
+
+if __name__ == "__main__":
+    from main import create_grid_network
+
+    sim = Simulator(total_time=2000, dt=1.0)
+    create_grid_network(sim, rows=3, cols=3)
+    service = SimulationService(sim, real_time_factor=10.0, spawn_rate=10, spawn_interval=1)
+    asyncio.run(service.serve())
@@ -9,13 +9,14 @@ from typing import List, Dict, Optional, Tuple, Any
 from Intersection import Intersection
 from Road import Road
 from Vehicle import Vehicle
+from GridlockDetector import GridlockDetector
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
 class Simulator:
-    def __init__(self, total_time: int = 1000, dt: float = 1.0):
+    def __init__(self, total_time: int = 1000, dt: float = 1.0, gridlock_detector: Optional[GridlockDetector] = None):
         self.graph = nx.DiGraph() 
         self.intersections: Dict[int, Intersection] = {}
         self.roads: Dict[Tuple[int, int], Road] = {} 
@@ -25,6 +26,10 @@ class Simulator:
         self.dt = dt
         self.next_vehicle_id = 1
         self.completed_vehicles = []
+        # Optional, when set it watches the intersection queues for gridlocks and applies its policy
+        self.gridlock_detector = gridlock_detector
+        self.removed_vehicles = []
+        self.halted = False
         
     def add_intersection(self, node_id: int):
         if node_id not in self.intersections:
@@ -49,6 +54,9 @@ class Simulator:
     def finalize_network_setup(self):
         """Finalize setup (e.g., traffic lights) after all roads are added."""
         for intersection in self.intersections.values():
+            # Finalizing again would reset the light and empty the queues, e.g. when run() follows a manual setup
+            if intersection.traffic_light is not None:
+                continue
             intersection.finalize_setup()
             logging.info(f"Intersection {intersection.node_id} finalized with {len(intersection.incoming_roads)} incoming roads.")
         
@@ -139,15 +147,56 @@ class Simulator:
         for intersection in self.intersections.values():
             intersection.process_queue(self, self.dt)
             
+        if self.gridlock_detector:
+            self.handle_gridlocks()
+            
         self.current_time += self.dt
+
+    def handle_gridlocks(self):
+        """Report newly detected gridlocks and stalled roads, then apply the detector's policy."""
+        detector = self.gridlock_detector
+        new_gridlocks, new_stalls = detector.check(self.current_time, lambda road_key: not self.roads[road_key].can_enter())
+        
+        if new_stalls:
+            logging.warning(f"Time {self.current_time:.0f}s: {len(new_stalls)} road(s) stalled for over {detector.stall_threshold:.0f}s: {new_stalls}")
+            
+        for cycle in new_gridlocks:
+            logging.warning(f"Time {self.current_time:.0f}s: Gridlock detected across roads {list(cycle)}")
+            
+            if detector.policy == 'remove_vehicle':
+                self.free_road_capacity(cycle[0], detector.waits_on[cycle[0]])
+            elif detector.policy == 'halt':
+                self.halted = True
+                
+    def free_road_capacity(self, road_key: Tuple[int, int], wanted_key: Tuple[int, int]):
+        """Break a confirmed gridlock: take vehicles off the back of the full road `wanted_key` until the queue from `road_key` can enter it."""
+        wanted_road = self.roads.get(wanted_key)
+        if not wanted_road:
+            logging.error(f"Road {wanted_key} does not exist, cannot free capacity on it")
+            return
         
+        while wanted_road.vehicles_on_road and not wanted_road.can_enter():
+            # The last vehicle is the one closest to the start of the road, the one blocking new entries
+            vehicle_id = wanted_road.vehicles_on_road[-1][0]
+            wanted_road.remove_vehicle(vehicle_id)
+            vehicle = self.vehicles.pop(vehicle_id, None)
+            if vehicle:
+                vehicle.status = 'removed'
+                vehicle.current_road = None
+                self.removed_vehicles.append(vehicle)
+                logging.info(f"Vehicle {vehicle_id} removed from road {wanted_key} to break a gridlock")
+        
+        # Drop the wait-for edge so the cycle is detected and resolved again if the road fills back up before the queue moves
+        if self.gridlock_detector:
+            self.gridlock_detector.mark_clear(road_key)
+            
     def run(self, spawn_rate: float = 0.01, spawn_interval: int = 10):
         """Run the simulation."""
         self.finalize_network_setup()
         logging.info("Starting simulation...")
         
         step_count = 0
-        while self.current_time < self.total_time:
+        while self.current_time < self.total_time and not self.halted:
             # Spawn vehicles periodically
             if step_count % spawn_interval == 0:
                 self.spawn_random_vehicles(spawn_rate)
@@ -164,6 +213,8 @@ class Simulator:
                      log_msg += f" | Avg Travel Time: {metrics['avg_travel_time']:.1f}s"
                 logging.info(log_msg)
             
+        if self.halted:
+            logging.warning(f"Simulation halted at {self.current_time:.0f}s because of a gridlock.")
         logging.info("Simulation complete!")
         
     def spawn_random_vehicles(self, spawn_rate: float):
@@ -204,13 +255,17 @@ class Simulator:
         total_congestion = sum(road.get_congestion() for road in self.roads.values())
         avg_congestion = total_congestion / len(self.roads) if self.roads else 0.0
         
-        return {
+        metrics = {
             'active_vehicles': active_vehicles,
             'completed_vehicles': completed_vehicles,
             'avg_travel_time': avg_travel_time,
             'avg_wait_time': avg_wait_time,
             'avg_congestion': avg_congestion
         }
+        if self.gridlock_detector:
+            metrics.update(self.gridlock_detector.get_metrics())
+            metrics['removed_vehicles'] = len(self.removed_vehicles)
+        return metrics
         
     def visualize(self):
         """Since the graph is too huge, visualising the entire is impossible. So visualising a small part of it."""
@@ -36,7 +36,26 @@ class TrafficLight:
                 self.current_phase_index = (self.current_phase_index + 1) % self.incoming_road_count
                 self.is_green_phase = True
                 self.time_in_phase = 0.0
-                
+
+    # Raises ValueError for invalid durations, None means "keep the current one"
+    @staticmethod
+    def validate_durations(green_duration: Optional[int] = None, yellow_duration: Optional[int] = None):
+        if green_duration is not None and green_duration <= 0:
+            raise ValueError("Green duration must be positive")
+        if yellow_duration is not None and yellow_duration < 0:
+            raise ValueError("Yellow duration cannot be negative")
+
+    # Changes the green/yellow durations while the simulation is running
+    # The current phase is kept, the new durations apply from the ongoing phase itself
+    # Both values are checked before anything is changed
+    def set_durations(self, green_duration: Optional[int] = None, yellow_duration: Optional[int] = None):
+        self.validate_durations(green_duration, yellow_duration)
+        if green_duration is not None:
+            self.green_duration = green_duration
+        if yellow_duration is not None:
+            self.yellow_duration = yellow_duration
+        self.cycle_length = (self.green_duration + self.yellow_duration) * self.incoming_road_count
+
     # Checks if the traffic light is green for a given lane index
     def is_green(self, incoming_road_index: int) -> bool:
         return self.is_green_phase and (self.current_phase_index == incoming_road_index)
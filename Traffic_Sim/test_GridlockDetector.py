@@ -0,0 +1,186 @@
+import logging
+import unittest
+
+from GridlockDetector import GridlockDetector
+from Simulator import Simulator
+from Vehicle import Vehicle
+
+
+class GridlockDetectorTest(unittest.TestCase):
+    def setUp(self):
+        self.detector = GridlockDetector(gridlock_threshold=10.0, stall_threshold=20.0)
+
+    def test_two_road_cycle_closes_and_clears(self):
+        self.detector.mark_blocked((0, 1), (1, 0), 0.0)
+        self.assertEqual(self.detector.check(5.0), ([], []))
+
+        self.detector.mark_blocked((1, 0), (0, 1), 2.0)
+        self.assertEqual(self.detector.check(11.0), ([], []))
+        gridlocks, _ = self.detector.check(12.0)
+        self.assertEqual(len(gridlocks), 1)
+        self.assertEqual(set(gridlocks[0]), {(0, 1), (1, 0)})
+        self.assertTrue(self.detector.is_gridlocked())
+
+        # Reported only once
+        self.assertEqual(self.detector.check(13.0)[0], [])
+
+        self.detector.mark_clear((1, 0))
+        self.assertFalse(self.detector.is_gridlocked())
+        self.assertEqual(self.detector.get_metrics()['gridlocks_detected'], 1)
+        self.assertEqual(self.detector.get_metrics()['blocked_roads'], 1)
+
+    def test_self_edge_is_not_a_cycle(self):
+        self.detector.mark_blocked((0, 1), (0, 1), 0.0)
+        self.assertEqual(self.detector.check(100.0), ([], []))
+        self.assertEqual(self.detector.get_metrics()['blocked_roads'], 0)
+
+    def test_self_edge_replaces_previous_edge(self):
+        self.detector.mark_blocked((0, 1), (1, 0), 0.0)
+        self.detector.mark_blocked((1, 0), (0, 1), 0.0)
+        self.detector.mark_blocked((0, 1), (0, 1), 1.0)
+        self.assertEqual(self.detector.check(100.0)[0], [])
+
+    def test_cycle_not_reported_while_wanted_road_can_be_entered(self):
+        self.detector.mark_blocked((0, 1), (1, 2), 0.0)
+        self.detector.mark_blocked((1, 2), (2, 0), 0.0)
+        self.detector.mark_blocked((2, 0), (0, 1), 0.0)
+        full_roads = {(0, 1), (1, 2)}
+
+        self.assertEqual(self.detector.check(10.0, lambda road: road in full_roads)[0], [])
+        # The timer restarts, so the cycle needs a full threshold of being blocked again
+        full_roads.add((2, 0))
+        self.assertEqual(self.detector.check(15.0, lambda road: road in full_roads)[0], [])
+        gridlocks, _ = self.detector.check(20.0, lambda road: road in full_roads)
+        self.assertEqual(len(gridlocks), 1)
+
+    def test_stall_reporting(self):
+        self.detector.mark_blocked((0, 1), (1, 2), 0.0)
+        self.detector.mark_blocked((3, 1), (1, 2), 5.0)
+        self.assertEqual(self.detector.check(19.0)[1], [])
+        self.assertEqual(self.detector.check(20.0)[1], [(0, 1)])
+        self.assertEqual(self.detector.check(25.0)[1], [(3, 1)])
+        self.assertEqual(self.detector.check(30.0)[1], [])
+        self.assertEqual(self.detector.get_metrics()['stalled_roads'], 2)
+
+        self.detector.mark_clear((0, 1))
+        self.assertEqual(self.detector.get_metrics()['stalled_roads'], 1)
+
+    def test_mark_clear_on_reported_cycle(self):
+        self.detector.mark_blocked((0, 1), (1, 2), 0.0)
+        self.detector.mark_blocked((1, 2), (2, 0), 0.0)
+        self.detector.mark_blocked((2, 0), (0, 1), 0.0)
+        self.assertEqual(len(self.detector.check(10.0)[0]), 1)
+
+        self.detector.mark_clear((1, 2))
+        self.assertFalse(self.detector.is_gridlocked())
+        self.assertEqual(self.detector.get_metrics()['active_gridlocks'], 0)
+
+        # Closing the same cycle again is detected as a new gridlock
+        self.detector.mark_blocked((1, 2), (2, 0), 12.0)
+        self.assertEqual(self.detector.check(21.0)[0], [])
+        self.assertEqual(len(self.detector.check(22.0)[0]), 1)
+        self.assertEqual(self.detector.get_metrics()['gridlocks_detected'], 2)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            GridlockDetector(policy='explode')
+
+
+# Ring 0 -> 1 -> 2 -> 0 where every road is full of stopped vehicles
+# and every queue head wants the next road of the ring
+def make_gridlocked_ring(detector: GridlockDetector) -> Simulator:
+    sim = Simulator(total_time=1000, dt=1.0, gridlock_detector=detector)
+    ring = [0, 1, 2]
+    for node in ring:
+        sim.add_intersection(node)
+    for node in ring:
+        # Length 14 gives a capacity of 2 vehicles
+        sim.add_road(node, (node + 1) % 3, length=14.0)
+    sim.finalize_network_setup()
+
+    for node in ring:
+        road = sim.get_road(node, (node + 1) % 3)
+        for position in (5.0, 0.0):
+            vehicle = Vehicle(sim.next_vehicle_id, node, (node + 1) % 3, sim.graph)
+            vehicle.max_speed = 0.0
+            road.add_vehicle(vehicle.vehicle_id)
+            road.update_vehicle_position(vehicle.vehicle_id, position)
+            vehicle.current_road = road
+            vehicle.position_on_road = position
+            vehicle.status = 'traveling'
+            sim.vehicles[vehicle.vehicle_id] = vehicle
+            sim.next_vehicle_id += 1
+        assert not road.can_enter()
+
+    for node in ring:
+        previous_node = (node - 1) % 3
+        vehicle = Vehicle(sim.next_vehicle_id, previous_node, (node + 1) % 3, sim.graph)
+        vehicle.path = [previous_node, node, (node + 1) % 3]
+        vehicle.path_index = 1
+        vehicle.status = 'waiting_at_light'
+        sim.vehicles[vehicle.vehicle_id] = vehicle
+        sim.intersections[node].enqueue_vehicle(vehicle.vehicle_id, sim.get_road(previous_node, node))
+        sim.next_vehicle_id += 1
+    return sim
+
+
+class SimulatorGridlockTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_halt_stops_run(self):
+        sim = make_gridlocked_ring(GridlockDetector(gridlock_threshold=5.0, policy='halt'))
+        sim.run(spawn_rate=0, spawn_interval=1)
+
+        self.assertTrue(sim.halted)
+        self.assertEqual(sim.current_time, 6.0)
+        self.assertEqual(sim.collect_metrics()['gridlocks_detected'], 1)
+        self.assertEqual(len(sim.gridlock_detector.gridlocked_cycles), 1)
+
+    def test_report_keeps_running(self):
+        sim = make_gridlocked_ring(GridlockDetector(gridlock_threshold=5.0, policy='report'))
+        sim.total_time = 50
+        sim.run(spawn_rate=0, spawn_interval=1)
+
+        self.assertFalse(sim.halted)
+        self.assertEqual(sim.current_time, 50.0)
+        self.assertEqual(sim.collect_metrics()['gridlocks_detected'], 1)
+        self.assertEqual(sim.removed_vehicles, [])
+
+    def test_remove_vehicle_frees_wanted_road(self):
+        detector = GridlockDetector(gridlock_threshold=5.0, policy='remove_vehicle')
+        sim = make_gridlocked_ring(detector)
+        waits_on = {}
+        while not sim.removed_vehicles:
+            waits_on = dict(detector.waits_on)
+            sim.step()
+            self.assertLess(sim.current_time, 10.0)
+
+        self.assertEqual(len(waits_on), 3)
+        freed = [road for road, wanted in waits_on.items() if sim.roads[wanted].can_enter()]
+        self.assertEqual(len(freed), 1)
+        road, wanted = freed[0], waits_on[freed[0]]
+
+        # Only the vehicle at the start of the road had to go
+        self.assertEqual(len(sim.removed_vehicles), 1)
+        removed = sim.removed_vehicles[0]
+        self.assertEqual(removed.status, 'removed')
+        self.assertNotIn(removed.vehicle_id, sim.vehicles)
+        self.assertNotIn(removed.vehicle_id, [vid for vid, _ in sim.roads[wanted].vehicles_on_road])
+        self.assertEqual(sim.roads[wanted].vehicles_on_road[0][1], 5.0)
+
+        # The wait-for edge is dropped and the cycle with it
+        self.assertNotIn(road, detector.waits_on)
+        self.assertFalse(detector.is_gridlocked())
+
+        # The queue head waiting on the freed road enters it on the next green step
+        head_id = sim.intersections[road[1]].queues[road[0]][0]
+        sim.step()
+        self.assertIs(sim.vehicles[head_id].current_road, sim.roads[wanted])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import logging
+import random
+import unittest
+
+from Simulator import Simulator
+from SimulationService import SimulationService
+from main import create_grid_network
+
+
+def make_service(**kwargs) -> SimulationService:
+    random.seed(0)
+    sim = Simulator(total_time=10 ** 7, dt=1.0)
+    create_grid_network(sim, rows=2, cols=2)
+    kwargs.setdefault('spawn_rate', 2)
+    kwargs.setdefault('spawn_interval', 1)
+    return SimulationService(sim, port=0, real_time_factor=None, **kwargs)
+
+
+class SimulationServiceTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    # Starts the service, connects one client and runs `scenario(service, reader, writer)`
+    def run_scenario(self, service: SimulationService, scenario):
+        async def main():
+            serve_task = asyncio.ensure_future(service.serve())
+            while service._server is None:
+                await asyncio.sleep(0.01)
+            reader, writer = await asyncio.open_connection('127.0.0.1', service.port)
+            try:
+                await asyncio.wait_for(scenario(service, reader, writer), 10)
+            finally:
+                service.stop()
+                await asyncio.wait_for(serve_task, 5)
+                writer.close()
+        asyncio.run(main())
+
+    @staticmethod
+    async def send(writer: asyncio.StreamWriter, command: dict):
+        writer.write((json.dumps(command) + '\n').encode())
+        await writer.drain()
+
+    @staticmethod
+    async def receive(reader: asyncio.StreamReader, message_type: str) -> dict:
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("Socket closed")
+            message = json.loads(line)
+            if message['type'] == message_type:
+                return message
+
+    def test_subscribe_sends_snapshot_then_diffs(self):
+        async def scenario(service, reader, writer):
+            await self.send(writer, {'cmd': 'subscribe'})
+            reply = await self.receive(reader, 'reply')
+            self.assertTrue(reply['ok'])
+
+            first = await self.receive(reader, 'metrics')
+            expected_keys = set(service.sim.collect_metrics()) | {'finished', 'paused'}
+            self.assertEqual(set(first['changed']), expected_keys)
+
+            state = dict(first['changed'])
+            last_step = first['step']
+            for _ in range(20):
+                message = await self.receive(reader, 'metrics')
+                self.assertGreater(message['step'], last_step)
+                self.assertEqual(message['time'], message['step'] * service.sim.dt)
+                for key, value in message['changed'].items():
+                    self.assertNotEqual(state[key], value)
+                state.update(message['changed'])
+                last_step = message['step']
+
+        self.run_scenario(make_service(), scenario)
+
+    def test_invalid_set_light_changes_nothing(self):
+        async def scenario(service, reader, writer):
+            await self.send(writer, {'cmd': 'set_light', 'node_id': 0, 'green_duration': 5, 'yellow_duration': -1})
+            reply = await self.receive(reader, 'reply')
+            self.assertFalse(reply['ok'])
+
+            intersection = service.sim.intersections[0]
+            self.assertEqual(intersection.green_duration, 15)
+            self.assertEqual(intersection.traffic_light.green_duration, 15)
+            self.assertEqual(intersection.traffic_light.yellow_duration, 3)
+
+        self.run_scenario(make_service(), scenario)
+
+    def test_stop_is_replied_before_close(self):
+        async def scenario(service, reader, writer):
+            await self.send(writer, {'cmd': 'stop'})
+            reply = await self.receive(reader, 'reply')
+            self.assertEqual(reply['cmd'], 'stop')
+            self.assertTrue(reply['ok'])
+            self.assertEqual(await reader.read(), b'')
+
+        self.run_scenario(make_service(), scenario)
+
+    def test_step_exception_sends_error_and_stops(self):
+        service = make_service()
+        step = service.sim.step
+        fail_at = []
+
+        def failing_step():
+            if fail_at and service.step_count == fail_at[0]:
+                raise RuntimeError("boom")
+            step()
+        service.sim.step = failing_step
+
+        async def scenario(service, reader, writer):
+            await self.send(writer, {'cmd': 'subscribe'})
+            await self.receive(reader, 'reply')
+            fail_at.append(service.step_count + 5)
+            error = await self.receive(reader, 'error')
+            self.assertEqual(error['error'], "boom")
+            self.assertEqual(error['step'], fail_at[0])
+            # serve() returns on its own, the socket gets closed after the final metrics
+            await reader.read()
+            self.assertTrue(reader.at_eof())
+            self.assertTrue(service._stop_event.is_set())
+
+        self.run_scenario(service, scenario)
+
+    def test_pause_stops_stepping(self):
+        async def scenario(service, reader, writer):
+            await self.send(writer, {'cmd': 'pause'})
+            await self.receive(reader, 'reply')
+            paused_at = service.step_count
+            await asyncio.sleep(0.2)
+            self.assertEqual(service.step_count, paused_at)
+
+            await self.send(writer, {'cmd': 'resume'})
+            await self.receive(reader, 'reply')
+            await asyncio.sleep(0.1)
+            self.assertGreater(service.step_count, paused_at)
+
+        self.run_scenario(make_service(), scenario)
+
+
+if __name__ == '__main__':
+    unittest.main()